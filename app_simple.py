@@ -5,15 +5,23 @@ Simple multi-company financial report comparison tool
 import streamlit as st
 import pandas as pd
 import os
+import shutil
 import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 from typing import List, Dict, Optional
 
 # Import core modules
 from core.parse_pdf import PDFParser
-from core.metrics import FinancialCalculator
+from core.metrics import FinancialCalculator, CompanyMetrics
 from core.llm import GeminiLLMClient, MockLLMClient
 from core.embed_retrieval import EmbeddingService
+from core.viz import FinancialVisualizer
+
+@st.cache_resource
+def get_visualizer() -> FinancialVisualizer:
+    """Build the visualizer once per server process"""
+    return FinancialVisualizer()
 
 # Configure page
 st.set_page_config(
@@ -68,46 +76,72 @@ def handle_upload_and_extract():
         if st.button("🚀 Extract Financial Data", type="primary"):
             extract_financial_data(uploaded_files, company_names)
 
+# Per-worker singletons: each pool process builds these once and
+# reuses them for every file it handles
+_PARSER = None
+_CALCULATOR = None
+
+def _process_one(pdf_path: str, company_name: str, fiscal_year: int) -> CompanyMetrics:
+    """Parse one PDF and compute its metrics (runs in a worker process)"""
+    global _PARSER, _CALCULATOR
+    if _PARSER is None:
+        _PARSER = PDFParser()
+        _CALCULATOR = FinancialCalculator()
+    parser, calculator = _PARSER, _CALCULATOR
+
+    # 已按檔案並行，頁級解析釘在單行程，避免每個 worker 再開一池
+    report = parser.parse_pdf(pdf_path, company_name, fiscal_year, max_workers=1)
+
+    statements = parser.extract_financial_statements(report)
+    figures = calculator.extract_key_figures(report, statements)
+    metrics = calculator.calculate_ratios(figures)
+
+    metrics.company = company_name
+    return metrics
+
 def extract_financial_data(uploaded_files, company_names):
-    """Extract financial data from uploaded PDFs"""
-    
+    """Extract financial data from uploaded PDFs in parallel"""
+
     progress_bar = st.progress(0)
     status_text = st.empty()
-    
-    for i, (file, company_name) in enumerate(zip(uploaded_files, company_names)):
-        progress_bar.progress((i + 0.5) / len(uploaded_files))
-        status_text.text(f"Processing {company_name}...")
-        
-        # Save temporary file
+
+    if 'company_metrics' not in st.session_state:
+        st.session_state.company_metrics = []
+
+    # Write all temp files first (cheap I/O), then parse in parallel:
+    # PDF parsing is CPU-bound, so worker processes scale near-linearly
+    temp_paths = []
+    for file in uploaded_files:
         with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-            temp_file.write(file.read())
-            temp_file_path = temp_file.name
-        
-        try:
-            # Parse PDF
-            parser = PDFParser()
-            report = parser.parse_pdf(temp_file_path, company_name, 2024)
-            
-            # Calculate financial metrics
-            calculator = FinancialCalculator()
-            statements = parser.extract_financial_statements(report)
-            figures = calculator.extract_key_figures(report, statements)
-            metrics = calculator.calculate_ratios(figures)
-            
-            # Store in session state
-            if 'company_metrics' not in st.session_state:
-                st.session_state.company_metrics = []
-            
-            metrics.company = company_name
-            st.session_state.company_metrics.append(metrics)
-            
-            progress_bar.progress((i + 1) / len(uploaded_files))
-            
-        except Exception as e:
-            st.error(f"Error processing {company_name}: {str(e)}")
-        finally:
-            os.unlink(temp_file_path)
-    
+            # Stream in 1 MiB chunks; file.read() would hold the whole
+            # PDF in memory on top of Streamlit's own upload buffer
+            shutil.copyfileobj(file, temp_file, length=1024 * 1024)
+            temp_paths.append(temp_file.name)
+
+    status_text.text(f"Processing {len(uploaded_files)} files...")
+    done = 0
+
+    try:
+        max_workers = min(len(uploaded_files), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {
+                pool.submit(_process_one, path, name, 2024): name
+                for path, name in zip(temp_paths, company_names)
+            }
+
+            for future in as_completed(futures):
+                company_name = futures[future]
+                try:
+                    st.session_state.company_metrics.append(future.result())
+                except Exception as e:
+                    st.error(f"Error processing {company_name}: {str(e)}")
+
+                done += 1
+                progress_bar.progress(done / len(uploaded_files))
+    finally:
+        for path in temp_paths:
+            os.unlink(path)
+
     status_text.text("✅ Processing complete!")
     st.success(f"Successfully processed {len(company_names)} companies!")
 
@@ -120,8 +154,7 @@ def show_financial_data():
         return
     
     # Display metrics overview
-    from core.viz import FinancialVisualizer
-    visualizer = FinancialVisualizer()
+    visualizer = get_visualizer()
     visualizer.create_metrics_overview_cards(st.session_state.company_metrics)
     
     # Comparison charts
@@ -3,9 +3,16 @@
 支援文本嵌入和向量檢索功能
 """
 import os
+import hashlib
+import pickle
+import sqlite3
+from collections import defaultdict
+from dataclasses import dataclass, asdict
 from typing import List, Dict, Optional
 from dotenv import load_dotenv
 
+from core.parse_pdf import PDFParser
+
 try:
     import numpy as np
 except ImportError:
@@ -24,18 +31,71 @@ except ImportError:
 # 加載環境變數
 load_dotenv()
 
+@dataclass(slots=True)
+class SearchHit:
+    """
+    單筆檢索結果
+    固定欄位的 slots 物件，比逐筆 dict 省一半記憶體、屬性存取也更快
+    """
+    chunk_id: str
+    text: str
+    page_ref: str
+    doc_id: str
+    company: str
+    similarity_score: float
+    section_type: str
+
+    def to_dict(self) -> Dict:
+        """轉成 dict 供序列化或既有 dict 介面使用"""
+        return asdict(self)
+
 class EmbeddingService:
-    def __init__(self):
+    def __init__(self, cache_path: str = '.embed_cache.db'):
         self.api_key = os.getenv('GEMINI_API_KEY')
         self.model_name = 'models/text-embedding-004'
-        
+
         if not self.api_key or genai is None:
             print("警告: 未設置 GEMINI_API_KEY 或未安裝 google-generativeai，向量檢索功能將使用模擬模式")
             self.client = None
         else:
             genai.configure(api_key=self.api_key)
             self.client = genai
-    
+
+        # 磁碟嵌入快取：重複文本直接從本地讀取，不再重打 API
+        self._cache = sqlite3.connect(cache_path, check_same_thread=False)
+        self._cache.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings "
+            "(hash TEXT PRIMARY KEY, dim INT, vec BLOB)"
+        )
+        self._cache.commit()
+
+    @staticmethod
+    def _text_hash(text: str) -> str:
+        """計算文本的快取鍵"""
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def _cache_lookup(self, hashes: List[str]) -> Dict[str, np.ndarray]:
+        """一次查詢撈出所有快取命中的向量"""
+        hits = {}
+        for start in range(0, len(hashes), 500):  # SQLite 變數數量上限
+            batch = hashes[start:start + 500]
+            placeholders = ','.join('?' * len(batch))
+            rows = self._cache.execute(
+                f"SELECT hash, vec FROM embeddings WHERE hash IN ({placeholders})",
+                batch
+            ).fetchall()
+            for h, blob in rows:
+                hits[h] = np.frombuffer(blob, dtype=np.float32)
+        return hits
+
+    def _cache_store(self, items: List[tuple]) -> None:
+        """批量寫入新向量 (hash, vec)"""
+        self._cache.executemany(
+            "INSERT OR REPLACE INTO embeddings (hash, dim, vec) VALUES (?, ?, ?)",
+            [(h, len(vec), vec.tobytes()) for h, vec in items]
+        )
+        self._cache.commit()
+
     def is_available(self) -> bool:
         """檢查嵌入服務是否可用"""
         return self.client is not None
@@ -82,75 +142,260 @@ class EmbeddingService:
             print(f"查詢嵌入生成失敗: {e}")
             return self._generate_mock_embedding(query)
     
-    def embed_batch(self, texts: List[str]) -> List[np.ndarray]:
+    def embed_batch(self, texts: List[str], batch_size: int = 100,
+                    out: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
         """
         批量生成嵌入向量
+        一次 API 調用處理整批文本，避免逐筆請求的網路往返延遲
+        傳入 out 時結果逐列寫進預配置矩陣，不產生中間 list 複製
         """
-        embeddings = []
-        
-        for text in texts:
-            embedding = self.embed_text(text)
-            if embedding is not None:
-                embeddings.append(embedding)
-            else:
-                embeddings.append(np.zeros(768, dtype=np.float32))
-        
-        return embeddings
+        if not texts:
+            return out
+
+        if not self.is_available():
+            return self._generate_mock_embeddings_batch(texts, out=out)
+
+        # 先查磁碟快取，只有未命中的文本才送 API
+        hashes = [self._text_hash(text) for text in texts]
+        cached = self._cache_lookup(hashes)
+        miss_indices = [i for i, h in enumerate(hashes) if h not in cached]
+
+        if miss_indices:
+            miss_texts = [texts[i] for i in miss_indices]
+            new_vectors = []
+
+            # 分批送出，respect API 單次請求上限
+            for start in range(0, len(miss_texts), batch_size):
+                batch = miss_texts[start:start + batch_size]
+                try:
+                    result = genai.embed_content(
+                        model=self.model_name,
+                        content=batch,
+                        task_type="retrieval_document"
+                    )
+                    # 批量回應為 list-of-lists，一次轉為矩陣再拆列
+                    matrix = np.asarray(result['embedding'], dtype=np.float32)
+                    new_vectors.extend(matrix)
+                except Exception as e:
+                    print(f"批量嵌入生成失敗: {e}")
+                    new_vectors.extend(self._generate_mock_embedding(text) for text in batch)
+
+            new_items = [(hashes[i], vec) for i, vec in zip(miss_indices, new_vectors)]
+            self._cache_store(new_items)
+            cached.update(new_items)
+
+        # 按原始順序組回結果
+        if out is not None:
+            for i, h in enumerate(hashes):
+                out[i] = cached[h]
+            return out
+        return np.stack([cached[h] for h in hashes])
     
+    @staticmethod
+    def _mock_seed(text: str) -> int:
+        """
+        計算跨進程穩定的播種值
+        內建 hash() 受 PYTHONHASHSEED 隨機化影響，跨執行會變動，
+        blake2b 則對相同文本永遠給出相同種子
+        """
+        return int.from_bytes(
+            hashlib.blake2b(text.encode('utf-8'), digest_size=4).digest(), 'little')
+
     def _generate_mock_embedding(self, text: str, dim: int = 768) -> np.ndarray:
         """
         生成模擬嵌入向量（基於文本哈希）
         """
-        # 使用文本哈希生成確定性的模擬向量
-        np.random.seed(hash(text) % (2**32))
-        embedding = np.random.normal(0, 1, dim).astype(np.float32)
+        rng = np.random.default_rng(self._mock_seed(text))
+        embedding = rng.standard_normal(dim, dtype=np.float32)
         # 正規化
         embedding = embedding / np.linalg.norm(embedding)
         return embedding
 
+    def _generate_mock_embeddings_batch(self, texts: List[str], dim: int = 768,
+                                        out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        批量生成模擬嵌入向量
+        一次填滿 (N, dim) 矩陣並用單次廣播正規化所有列，
+        避免逐筆的 Python 層 norm 計算與暫存分配
+        """
+        mat = out if out is not None else np.empty((len(texts), dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            # 每列獨立播種，保持「相同文本 → 相同向量」的確定性
+            rng = np.random.default_rng(self._mock_seed(text))
+            mat[i] = rng.standard_normal(dim, dtype=np.float32)
+        mat /= np.linalg.norm(mat, axis=1, keepdims=True)
+        return mat
+
 class VectorRetriever:
     def __init__(self, embedding_service: EmbeddingService):
         self.embedding_service = embedding_service
         self.index = None
         self.chunks = []
         self.dimension = 768
+        # int8 索引的每向量 scale，查詢時用於補回分數重排
+        self._sq_scales = None
+        # 片段欄位的 SoA 視圖，查詢結果用向量化索引組裝
+        self._ids = None
+        self._texts = None
+        self._page_refs = None
+        self._doc_ids = None
+        self._companies = None
+        self._section_types = None
     
-    def build_index(self, chunks: List[Dict]) -> bool:
+    def build_index(self, chunks, embed_batch_size: int = 64) -> bool:
         """
         建立向量索引
+        chunks 可為 list 或惰性迭代器：片段一邊產生一邊以小批量嵌入，
+        寫入按需倍增的預配置矩陣，峰值記憶體貼近最終矩陣大小
         """
-        if not chunks:
+        self.chunks = []
+
+        # 相同文本只嵌入一次（報表頁眉/頁尾/制式附註大量逐字重複），
+        # 之後再散射回原始位置
+        unique_index = {}
+        positions = []
+        unique_rows = 0
+        unique_matrix = np.empty((256, self.dimension), dtype=np.float32)
+        pending = []
+
+        def flush_pending():
+            nonlocal unique_rows, unique_matrix, pending
+            if not pending:
+                return True
+            needed = unique_rows + len(pending)
+            if needed > unique_matrix.shape[0]:
+                grown = np.empty((max(needed, unique_matrix.shape[0] * 2), self.dimension),
+                                 dtype=np.float32)
+                grown[:unique_rows] = unique_matrix[:unique_rows]
+                unique_matrix = grown
+            out = unique_matrix[unique_rows:needed]
+            if self.embedding_service.embed_batch(pending, out=out) is None:
+                return False
+            unique_rows = needed
+            pending = []
+            return True
+
+        for chunk in chunks:
+            # 公司名稱在建索引時解析一次，查詢階段不再逐筆切字串
+            chunk['company'] = chunk.get('doc_id', '').split('_', 1)[0] or 'unknown'
+            self.chunks.append(chunk)
+
+            h = hashlib.blake2b(chunk['text'].encode('utf-8'), digest_size=16).digest()
+            idx = unique_index.get(h)
+            if idx is None:
+                idx = unique_rows + len(pending)
+                unique_index[h] = idx
+                pending.append(chunk['text'])
+                if len(pending) >= embed_batch_size:
+                    if not flush_pending():
+                        print("嵌入向量生成失敗")
+                        return False
+            positions.append(idx)
+
+        if not self.chunks:
             print("沒有內容用於建立索引")
             return False
-        
-        print(f"正在為 {len(chunks)} 個文檔片段建立向量索引...")
-        
-        # 提取文本
-        texts = [chunk['text'] for chunk in chunks]
-        
-        # 生成嵌入向量
-        embeddings = self.embedding_service.embed_batch(texts)
-        
-        if not embeddings:
+
+        if not flush_pending():
             print("嵌入向量生成失敗")
             return False
-        
-        # 建立 FAISS 索引
-        embeddings_matrix = np.array(embeddings).astype(np.float32)
-        self.dimension = embeddings_matrix.shape[1]
-        
+
+        embeddings_matrix = unique_matrix[:unique_rows][np.asarray(positions, dtype=np.int64)]
+
         if faiss is not None:
-            self.index = faiss.IndexFlatIP(self.dimension)
             faiss.normalize_L2(embeddings_matrix)
-            self.index.add(embeddings_matrix)
-        
-        # 保存文檔片段
-        self.chunks = chunks
-        
-        print(f"向量索引建立完成")
+            self.index = self._build_faiss_index(embeddings_matrix)
+
+        self._build_columns()
+
+        print(f"向量索引建立完成 ({len(self.chunks)} 個片段)")
         return True
-    
-    def search(self, query: str, top_k: int = 5) -> List[Dict]:
+
+    def _build_columns(self) -> None:
+        """
+        將片段欄位攤成平行陣列，查詢時以向量化索引取值
+        """
+        chunks = self.chunks
+        self._ids = np.asarray([c['chunk_id'] for c in chunks], dtype=object)
+        self._texts = np.asarray([c['text'] for c in chunks], dtype=object)
+        self._page_refs = np.asarray([c.get('page_ref', '') for c in chunks], dtype=object)
+        self._doc_ids = np.asarray([c.get('doc_id', '') for c in chunks], dtype=object)
+        self._companies = np.asarray([c.get('company', 'unknown') for c in chunks], dtype=object)
+        self._section_types = np.asarray([c.get('section_type', 'text') for c in chunks], dtype=object)
+
+    def _build_faiss_index(self, embeddings_matrix: np.ndarray):
+        """
+        建立 FAISS 索引
+        小量資料先量化為 int8 直存（QT_8bit_direct_signed），內積核心
+        走整數 SIMD 通道；數量足夠時改用 IVF + 8-bit 標量量化，
+        向量以 uint8 儲存，查詢時記憶體頻寬減為 1/4
+        """
+        n, d = embeddings_matrix.shape
+
+        # IVF 訓練需要足夠的向量數，小量資料走 int8 暴力索引
+        if n < 1024:
+            scales = np.abs(embeddings_matrix).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            quantized = np.round(embeddings_matrix / scales[:, None])
+
+            index = faiss.IndexScalarQuantizer(
+                d, faiss.ScalarQuantizer.QT_8bit_direct_signed,
+                faiss.METRIC_INNER_PRODUCT
+            )
+            index.add(quantized.astype(np.float32))
+            self._sq_scales = scales.astype(np.float32)
+            return index
+
+        self._sq_scales = None
+        nlist = max(4, int(np.sqrt(n)))
+        quantizer = faiss.IndexFlatIP(d)
+        index = faiss.IndexIVFScalarQuantizer(
+            quantizer, d, nlist,
+            faiss.ScalarQuantizer.QT_8bit,
+            faiss.METRIC_INNER_PRODUCT
+        )
+        index.train(embeddings_matrix)
+        index.add(embeddings_matrix)
+        index.nprobe = min(16, nlist)
+        return index
+
+    def save(self, path: str) -> bool:
+        """
+        將索引與文檔片段序列化到磁碟
+        """
+        if self.index is None or faiss is None:
+            return False
+
+        faiss.write_index(self.index, path + '.faiss')
+        with open(path + '.chunks.pkl', 'wb') as f:
+            pickle.dump((self.chunks, self._sq_scales), f)
+        return True
+
+    def load(self, path: str) -> bool:
+        """
+        從磁碟載入索引，mmap 模式由 OS page cache 供頁、不整份讀進 RAM
+        """
+        if faiss is None or not os.path.exists(path + '.faiss'):
+            return False
+
+        try:
+            self.index = faiss.read_index(
+                path + '.faiss',
+                faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+            )
+            with open(path + '.chunks.pkl', 'rb') as f:
+                self.chunks, self._sq_scales = pickle.load(f)
+            self._build_columns()
+            self.dimension = self.index.d
+            return True
+        except Exception as e:
+            print(f"載入向量索引失敗: {e}")
+            self.index = None
+            self.chunks = []
+            self._sq_scales = None
+            return False
+
+    def search(self, query: str, top_k: int = 5) -> List[SearchHit]:
         """
         執行向量檢索
         """
@@ -165,31 +410,52 @@ class VectorRetriever:
             return []
         
         # 正規化查詢向量
-        query_embedding = query_embedding.reshape(1, -1).astype(np.float32)
+        # reshape 只建立視圖，ascontiguousarray 在已是連續 float32 時
+        # 為 no-op——不像 .astype 每次查詢都複製一份
+        query_embedding = np.ascontiguousarray(
+            query_embedding.reshape(1, -1), dtype=np.float32)
         if faiss is not None:
             faiss.normalize_L2(query_embedding)
         
         results = []
-        
+
         if faiss is not None and self.index is not None:
-            # 執行搜索
-            scores, indices = self.index.search(query_embedding, min(top_k, len(self.chunks)))
-            
-            for score, idx in zip(scores[0], indices[0]):
-                if idx >= len(self.chunks):
-                    continue
-                
-                chunk = self.chunks[idx]
-                result = {
-                    'chunk_id': chunk['chunk_id'],
-                    'text': chunk['text'],
-                    'page_ref': chunk.get('page_ref', ''),
-                    'doc_id': chunk.get('doc_id', ''),
-                    'similarity_score': float(score),
-                    'section_type': chunk.get('section_type', 'text')
-                }
-                results.append(result)
-        
+            k = min(top_k, len(self.chunks))
+
+            if self._sq_scales is not None:
+                # 查詢向量同樣量化到 int8 值域
+                q_scale = float(np.abs(query_embedding).max()) / 127.0 or 1.0
+                quantized_query = np.round(query_embedding / q_scale)
+
+                # int8 分數缺少每向量 scale，先取較寬候選、補回後重排
+                k_wide = min(top_k * 4, len(self.chunks))
+                scores, indices = self.index.search(quantized_query, k_wide)
+                valid = indices[0] >= 0
+                hit_indices = indices[0][valid]
+                hit_scores = scores[0][valid] * self._sq_scales[hit_indices] * q_scale
+                order = np.argsort(-hit_scores)[:k]
+                hit_indices = hit_indices[order]
+                hit_scores = hit_scores[order]
+            else:
+                scores, indices = self.index.search(query_embedding, k)
+                hit_indices = indices[0]
+                hit_scores = scores[0]
+
+            # 無效索引用布林遮罩一次剔除，再以向量化索引取出各欄位
+            mask = (hit_indices >= 0) & (hit_indices < len(self.chunks))
+            hit_indices = hit_indices[mask]
+            hit_scores = hit_scores[mask]
+
+            results = [
+                SearchHit(chunk_id, text, page_ref, doc_id, company,
+                          float(score), section_type)
+                for chunk_id, text, page_ref, doc_id, company, section_type, score in zip(
+                    self._ids[hit_indices], self._texts[hit_indices],
+                    self._page_refs[hit_indices], self._doc_ids[hit_indices],
+                    self._companies[hit_indices], self._section_types[hit_indices],
+                    hit_scores)
+            ]
+
         return results
 
 class SemanticSearchEngine:
@@ -197,48 +463,66 @@ class SemanticSearchEngine:
     語義搜索引擎主類
     """
     
-    def __init__(self):
+    def __init__(self, index_cache_dir: str = '.index_cache'):
         self.embedding_service = EmbeddingService()
         self.retriever = VectorRetriever(self.embedding_service)
-    
+        self.index_cache_dir = index_cache_dir
+
     def initialize_from_reports(self, reports: List[Dict]) -> bool:
         """
         從報告初始化搜索引擎
+        相同報告組合的索引會從磁碟快取直接載入，跳過整個嵌入流程
         """
-        all_chunks = []
-        
-        # 收集所有文檔片段
+        # 快取鍵納入各報告的段落內容摘要：report_id 只有「公司_年度」，
+        # 同名公司換了檔案時內容摘要會變，避免命中舊索引回傳過期片段
+        hasher = hashlib.sha256()
+        for report in sorted((r for r in reports if hasattr(r, 'sections')),
+                             key=lambda r: r.report_id):
+            hasher.update(report.report_id.encode('utf-8'))
+            for section in report.sections:
+                hasher.update(section.content.encode('utf-8'))
+        cache_key = hasher.hexdigest()[:16]
+        cache_path = os.path.join(self.index_cache_dir, cache_key)
+
+        if self.retriever.load(cache_path):
+            print(f"從磁碟快取載入向量索引 ({len(self.retriever.chunks)} 個片段)")
+            return True
+
+        # 建立索引並寫入快取（片段以生成器惰性供給，不先整份收集）
+        if not self.retriever.build_index(self._iter_chunks(reports)):
+            return False
+
+        os.makedirs(self.index_cache_dir, exist_ok=True)
+        self.retriever.save(cache_path)
+        return True
+
+    @staticmethod
+    def _iter_chunks(reports):
+        """逐報告惰性產出文檔片段"""
+        parser = PDFParser()
         for report in reports:
             if hasattr(report, 'sections'):
-                from core.parse_pdf import PDFParser
-                parser = PDFParser()
-                chunks = parser.slice_content_for_search(report)
-                all_chunks.extend(chunks)
-        
-        # 建立索引
-        return self.retriever.build_index(all_chunks)
+                yield from parser.slice_content_for_search(report)
     
     def search_semantic(self, query: str, top_k: int = 10) -> Dict[str, List[Dict]]:
         """
         執行語義搜索，返回按公司分組的結果
+        SearchHit 在此邊界轉回 dict，下游（如 LLM 客戶端）維持既有的 dict 介面
         """
         print(f"🔍 執行語義搜索: '{query}'")
-        
+
         # 執行搜索
         results = self.retriever.search(query, top_k)
-        
+
         if not results:
             return {}
-        
-        # 按公司分組結果
-        grouped_results = {}
+
+        # 按公司分組結果（company 已在建索引時解析）
+        grouped_results = defaultdict(list)
         for result in results:
-            company = result.get('doc_id', '').split('_')[0] if result.get('doc_id') else 'unknown'
-            if company not in grouped_results:
-                grouped_results[company] = []
-            grouped_results[company].append(result)
-        
-        return grouped_results
+            grouped_results[result.company].append(result.to_dict())
+
+        return dict(grouped_results)
     
     def is_ready(self) -> bool:
         """
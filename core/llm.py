@@ -71,7 +71,7 @@ class GeminiLLMClient:
             )
         
         # 構建上下文
-        context_text = "\n\n".join([chunk['text'][:500] for chunk in context_chunks[:3]])
+        context_text = "\n\n".join(chunk['text'][:500] for chunk in context_chunks[:3])
         
         # 構建 prompt
         prompt = f"""你是一位專業的財務分析師。請根據提供的財報內容回答關於 {company} 的問題。
@@ -85,13 +85,16 @@ class GeminiLLMClient:
         
         try:
             response = self.client.generate_content(prompt)
-            sources = [chunk.get('page_ref', '') for chunk in context_chunks]
-            
+            # 只列出實際進入 prompt 的前 3 個片段來源；
+            # dict.fromkeys 單趟去重並保持順序（set 的順序不確定）
+            sources = list(dict.fromkeys(
+                chunk.get('page_ref', '') for chunk in context_chunks[:3]))
+
             return QueryResponse(
                 company=company,
                 query=query,
                 answer=response.text,
-                sources=list(set(sources)),
+                sources=sources,
                 confidence=0.8
             )
             
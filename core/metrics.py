@@ -8,6 +8,63 @@ import re
 from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass
 
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def _max_number_in_line(buf: np.ndarray, threshold: float) -> float:
+        """
+        逐字元狀態機掃描一行位元組，回傳大於門檻的最大數字
+        取代正則 + 逐 token float() 的 Python 路徑；無符合數字回傳 -1
+        """
+        best = -1.0
+        value = 0.0
+        frac = 0.0
+        frac_scale = 0.1
+        in_number = False
+        in_fraction = False
+
+        for i in range(buf.shape[0]):
+            c = buf[i]
+            if 48 <= c <= 57:  # '0'-'9'
+                digit = float(c - 48)
+                if in_fraction:
+                    frac += digit * frac_scale
+                    frac_scale *= 0.1
+                else:
+                    value = value * 10.0 + digit
+                in_number = True
+            elif c == 44 and in_number:  # ',' 千分位，略過
+                continue
+            elif c == 46 and in_number and not in_fraction:  # '.'
+                in_fraction = True
+            else:
+                if in_number:
+                    total = value + frac
+                    if total > threshold and total > best:
+                        best = total
+                    value = 0.0
+                    frac = 0.0
+                    frac_scale = 0.1
+                    in_number = False
+                    in_fraction = False
+
+        if in_number:
+            total = value + frac
+            if total > threshold and total > best:
+                best = total
+        return best
+else:
+    _max_number_in_line = None
+
 @dataclass
 class Metric:
     name: str
@@ -26,8 +83,8 @@ class CompanyMetrics:
     metrics: Dict[str, Metric]
 
 class FinancialCalculator:
-    def __init__(self):
-        self.ratio_definitions = {
+    # 比率定義與關鍵字映射為類別層級常量，實例化不再重建
+    ratio_definitions = {
             "profitability": {
                 "gross_margin": "毛利率",
                 "operating_margin": "營業利潤率", 
@@ -56,9 +113,9 @@ class FinancialCalculator:
                 "fcf_margin": "自由現金流利潤率"
             }
         }
-        
-        # 財務科目關鍵字映射
-        self.account_keywords = {
+
+    # 財務科目關鍵字映射
+    account_keywords = {
             'zh': {
                 'revenue': ['營業收入', '營收', '銷售收入', '總收入', '收入'],
                 'gross_profit': ['毛利', '銷售毛利'],
@@ -70,93 +127,133 @@ class FinancialCalculator:
                 'operating_cash_flow': ['營業活動現金流量', '經營活動現金流量']
             }
         }
-    
+
+    # 預編譯數字正則與關鍵字匹配器（類別層級，只建一次）
+    _num_re = re.compile(r'[\d,]+\.?\d*')
+    _ac = None
+    _group_patterns = None
+    _matchers_ready = False
+
+    def __init__(self):
+        if not FinancialCalculator._matchers_ready:
+            self._build_matchers()
+
+    @classmethod
+    def _build_matchers(cls):
+        """建構關鍵字匹配器並掛在類別上，之後的實例化為 O(1)"""
+        if ahocorasick is not None:
+            ac = ahocorasick.Automaton()
+            for group, keywords in cls.account_keywords['zh'].items():
+                # payload 帶上關鍵字順位：掃描後按順位擇優，
+                # 保留「營業收入」優先於泛稱「收入」的關鍵字優先序
+                for rank, kw in enumerate(keywords):
+                    ac.add_word(kw, (group, rank))
+            ac.make_automaton()
+            cls._ac = ac
+        else:
+            # 未安裝 pyahocorasick 時退回逐關鍵字的預編譯正則（依優先序排列）
+            cls._group_patterns = {
+                group: [re.compile(re.escape(kw)) for kw in keywords]
+                for group, keywords in cls.account_keywords['zh'].items()
+            }
+        cls._matchers_ready = True
+
     def extract_key_figures(self, report, statements: Dict[str, pd.DataFrame]) -> Dict[str, float]:
         """
         從財務報表中抽取關鍵數字
         """
         figures = {}
-        
+
         # 從損益表抽取
         if not statements['income'].empty:
-            figures.update(self._extract_from_income_statement(statements['income']))
-        
+            figures.update(self._extract_all(self._df_to_text(statements['income']),
+                                             ['revenue', 'net_income']))
+
         # 從資產負債表抽取
         if not statements['balance'].empty:
-            figures.update(self._extract_from_balance_sheet(statements['balance']))
-        
+            figures.update(self._extract_all(self._df_to_text(statements['balance']),
+                                             ['total_assets', 'shareholders_equity']))
+
         # 從現金流量表抽取
         if not statements['cashflow'].empty:
-            figures.update(self._extract_from_cashflow_statement(statements['cashflow']))
-        
-        return figures
-    
-    def _extract_from_income_statement(self, df: pd.DataFrame) -> Dict[str, float]:
-        """從損益表抽取數據"""
-        figures = {}
-        text_data = df.to_string()
-        
-        # 抽取營業收入
-        revenue = self._find_amount_by_keywords(text_data, self.account_keywords['zh']['revenue'])
-        if revenue:
-            figures['revenue'] = revenue
-        
-        # 抽取淨利
-        net_income = self._find_amount_by_keywords(text_data, self.account_keywords['zh']['net_income'])
-        if net_income:
-            figures['net_income'] = net_income
-        
-        return figures
-    
-    def _extract_from_balance_sheet(self, df: pd.DataFrame) -> Dict[str, float]:
-        """從資產負債表抽取數據"""
-        figures = {}
-        text_data = df.to_string()
-        
-        # 抽取總資產
-        total_assets = self._find_amount_by_keywords(text_data, self.account_keywords['zh']['total_assets'])
-        if total_assets:
-            figures['total_assets'] = total_assets
-        
-        # 抽取股東權益
-        shareholders_equity = self._find_amount_by_keywords(text_data, self.account_keywords['zh']['shareholders_equity'])
-        if shareholders_equity:
-            figures['shareholders_equity'] = shareholders_equity
-        
+            figures.update(self._extract_all(self._df_to_text(statements['cashflow']),
+                                             ['operating_cash_flow']))
+
         return figures
-    
-    def _extract_from_cashflow_statement(self, df: pd.DataFrame) -> Dict[str, float]:
-        """從現金流量表抽取數據"""
+
+    @staticmethod
+    def _df_to_text(df: pd.DataFrame) -> str:
+        """
+        將報表逐列攤平成純文字
+        以向量化的 astype + 逐列 join 取代 to_string 的逐格美化格式化
+        """
+        header = ' '.join(map(str, df.columns))
+        rows = df.astype(str).agg(' '.join, axis=1).tolist()
+        return header + '\n' + '\n'.join(rows)
+
+    def _extract_all(self, text_data: str, groups: List[str]) -> Dict[str, float]:
+        """
+        單次線性掃描文本，抽取指定科目群組的金額
+        """
+        wanted = set(groups)
         figures = {}
-        text_data = df.to_string()
-        
-        # 抽取營業活動現金流量
-        operating_cash_flow = self._find_amount_by_keywords(text_data, self.account_keywords['zh']['operating_cash_flow'])
-        if operating_cash_flow:
-            figures['operating_cash_flow'] = operating_cash_flow
-        
+
+        if self._ac is not None:
+            # Aho-Corasick：所有關鍵字仍只掃一趟，命中先按科目收集 (順位, 位置)，
+            # 掃完再依關鍵字優先序取金額——避免先出現的泛稱關鍵字
+            # （如「利息收入」裡的「收入」）搶走具體科目（「營業收入」）的值
+            candidates: Dict[str, List[Tuple[int, int]]] = {}
+            for end_pos, (group, rank) in self._ac.iter(text_data):
+                if group in wanted:
+                    candidates.setdefault(group, []).append((rank, end_pos))
+
+            for group, hits in candidates.items():
+                hits.sort()
+                for _, pos in hits:
+                    amount = self._amount_in_line(text_data, pos)
+                    if amount is not None:
+                        figures[group] = amount
+                        break
+        else:
+            # 後備路徑：關鍵字依優先序逐一嘗試，高順位關鍵字先於泛稱
+            for group in groups:
+                for pattern in self._group_patterns[group]:
+                    if group in figures:
+                        break
+                    for match in pattern.finditer(text_data):
+                        amount = self._amount_in_line(text_data, match.start())
+                        if amount is not None:
+                            figures[group] = amount
+                            break
+
         return figures
-    
-    def _find_amount_by_keywords(self, text: str, keywords: List[str]) -> Optional[float]:
+
+    def _amount_in_line(self, text: str, pos: int) -> Optional[float]:
         """
-        根據關鍵字在文字中查找金額
+        在關鍵字所在行內查找金額，取最大的數字（通常是主要金額）
         """
-        for keyword in keywords:
-            # 查找包含關鍵字的行
-            lines = text.split('\n')
-            for line in lines:
-                if keyword in line:
-                    # 提取數字
-                    numbers = re.findall(r'[\d,]+\.?\d*', line)
-                    if numbers:
-                        try:
-                            # 取最大的數字（通常是主要金額）
-                            amounts = [float(num.replace(',', '')) for num in numbers if float(num.replace(',', '')) > 1000]
-                            if amounts:
-                                return max(amounts)
-                        except ValueError:
-                            continue
-        return None
+        line_start = text.rfind('\n', 0, pos) + 1
+        line_end = text.find('\n', pos)
+        if line_end == -1:
+            line_end = len(text)
+        line = text[line_start:line_end]
+
+        # 有 numba 時走 JIT 字元掃描，完全繞過正則引擎
+        if _max_number_in_line is not None:
+            buf = np.frombuffer(line.encode('ascii', 'ignore'), dtype=np.uint8)
+            best = _max_number_in_line(buf, 1000.0)
+            return best if best >= 0 else None
+
+        # 整行一次去掉千分位逗號，之後的 token 可直接轉 float
+        line = line.replace(',', '')
+
+        numbers = self._num_re.findall(line)
+        if not numbers:
+            return None
+
+        amounts = np.fromiter(map(float, numbers), dtype=np.float64, count=len(numbers))
+        amounts = amounts[amounts > 1000]
+        return float(amounts.max()) if amounts.size else None
     
     def calculate_ratios(self, figures: Dict[str, float]) -> CompanyMetrics:
         """
@@ -2,135 +2,548 @@
 PDF 解析模組
 支援文字層 PDF 的解析，抽取文字和表格數據
 """
+import array
+import hashlib
+import os
+import pickle
+import re
+import numpy as np
 import pdfplumber
 import pandas as pd
-import re
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import cached_property
 from typing import Dict, List, Tuple, Optional
 from dataclasses import dataclass
-from enum import Enum
-
-class SectionType(Enum):
-    TEXT = "text"
-    TABLE = "table"
-    FIGURE = "figure"
-
-@dataclass
-class Section:
-    type: SectionType
-    page_from: int
-    page_to: int
-    content: str
-    page_ref: str
-    raw_data: Optional[any] = None
-
-@dataclass
-class Report:
-    report_id: str
-    company: str
-    fiscal_year: int
-    period: str  # FY, Q1, Q2, Q3, Q4, TTM
-    currency: str
-    sections: List[Section]
-    
-class PDFParser:
+from pdfminer.high_level import extract_text as pdfminer_extract_text
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# 解析結果快取的格式版本，schema 變動時遞增使舊快取失效
+PARSER_VERSION = 2
+
+_WORD_RE = re.compile(r'\S+')
+
+def _window_offsets(starts: np.ndarray, ends: np.ndarray, chunk_size: int) -> np.ndarray:
+    """
+    依每 chunk_size 個詞產生 (start, end) 字元位移視窗
+    之後每個 chunk 由原字串單次切片取得，不再逐視窗 join 詞列表
+    """
+    n = starts.shape[0]
+    count = (n + chunk_size - 1) // chunk_size
+    out = np.empty((count, 2), dtype=np.int64)
+    for w in range(count):
+        i = w * chunk_size
+        j = min(i + chunk_size, n) - 1
+        out[w, 0] = starts[i]
+        out[w, 1] = ends[j]
+    return out
+
+if numba is not None:
+    _window_offsets = numba.njit(cache=True)(_window_offsets)
+
+def _ascii_word_bounds(text: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    純 ASCII 文本的向量化詞邊界偵測
+    空白遮罩與邊界差分都是單趟 SIMD 化的 C 迴圈，
+    不經正則引擎；ASCII 下位元組位移即字元位移
+    """
+    buf = np.frombuffer(text.encode(), dtype=np.uint8)
+    ws = (buf == 32) | ((buf >= 9) & (buf <= 13))  # space, \t\n\v\f\r
+
+    # 兩端補「空白」哨兵，非空白段的進出轉折即詞的 start/end
+    padded = np.empty(buf.shape[0] + 2, dtype=np.int8)
+    padded[0] = 1
+    padded[-1] = 1
+    padded[1:-1] = ws
+    edges = np.diff(padded)
+    return np.flatnonzero(edges == -1), np.flatnonzero(edges == 1)
+
+def _iter_text_chunks(text: str, chunk_size: int):
+    """
+    惰性產生文本切片
+    ASCII 文本走 NumPy 向量化的空白偵測；含 CJK 等多位元組字元時
+    位元組位移與字元位移不一致，退回正則逐詞掃描。
+    每個 chunk 是原字串的單次切片，逐個 yield、不整批材料化
+    """
+    if text.isascii():
+        starts, ends = _ascii_word_bounds(text)
+        if starts.size == 0:
+            return
+    else:
+        # 詞位移經 fromiter 直接寫入 C 緩衝區（不經 Python list）
+        spans = np.fromiter(
+            (pos for m in _WORD_RE.finditer(text) for pos in (m.start(), m.end())),
+            dtype=np.int64
+        ).reshape(-1, 2)
+        if spans.size == 0:
+            return
+        starts = np.ascontiguousarray(spans[:, 0])
+        ends = np.ascontiguousarray(spans[:, 1])
+
+    windows = _window_offsets(starts, ends, chunk_size)
+    for start, end in windows:
+        yield text[start:end]
+
+# 段落類別以純字串表示（'text' / 'table' / 'figure'），
+# 比較走字串 interning 的指標相等快路徑，不經 Enum 成員查找
+def _section_df(raw_data) -> Optional[pd.DataFrame]:
+    """
+    惰性建構表格 DataFrame
+    解析階段只保留原始列資料，首次存取才付 pandas 建構成本
+    """
+    if raw_data is None:
+        return None
+    if isinstance(raw_data, pd.DataFrame):
+        return raw_data
+    return pd.DataFrame(raw_data[1:], columns=raw_data[0])
+
+if msgspec is not None:
+    # msgspec.Struct 為 C 實作：建構快、記憶體省，且可 pickle 進解析快取
+    # dict=True 留出實例字典讓 cached_property 可用
+    class Section(msgspec.Struct, dict=True):
+        type: str
+        page_from: int
+        page_to: int
+        content: str
+        page_ref: str
+        raw_data: Optional[any] = None  # 表格為原始 list[list[str]]
+
+        @cached_property
+        def df(self) -> Optional[pd.DataFrame]:
+            return _section_df(self.raw_data)
+else:
+    @dataclass
+    class Section:
+        type: str
+        page_from: int
+        page_to: int
+        content: str
+        page_ref: str
+        raw_data: Optional[any] = None  # 表格為原始 list[list[str]]
+
+        @cached_property
+        def df(self) -> Optional[pd.DataFrame]:
+            return _section_df(self.raw_data)
+
+_SECTION_TYPES_BY_CODE = ('text', 'table', 'figure')
+_SECTION_TYPE_CODES = {t: i for i, t in enumerate(_SECTION_TYPES_BY_CODE)}
+
+class SectionArray:
+    """
+    Section 的 struct-of-arrays 儲存
+    欄位放在平行陣列裡（型別/頁碼為緊湊的 C 陣列），
+    千頁報告不再配置上萬個 dataclass 實例；
+    遍歷或索引時才產生輕量 Section 視圖
+    """
+
     def __init__(self):
-        self.financial_keywords = {
-            'zh': [
-                '損益表', '綜合損益表', '利潤表', '收益表',
-                '資產負債表', '財務狀況表', '資產負債及股東權益表',
-                '現金流量表', '現金流表',
-                '營業收入', '營收', '銷售收入', '總收入',
-                '營業成本', '銷售成本', '營業費用',
-                '營業利益', '營業利潤', '經營利潤',
-                '稅前利益', '稅前利潤', '稅前盈餘',
-                '本期淨利', '淨利潤', '淨收益', '稅後淨利',
-                '總資產', '資產總額', '總負債', '負債總額',
-                '股東權益', '所有者權益', '淨資產',
-                '營業活動現金流量', '經營活動現金流量',
-                '投資活動現金流量', '融資活動現金流量'
-            ],
-            'en': [
-                'income statement', 'statement of income', 'profit and loss',
-                'balance sheet', 'statement of financial position',
-                'cash flow statement', 'statement of cash flows',
-                'revenue', 'sales', 'net sales', 'total revenue',
-                'cost of sales', 'cost of goods sold', 'operating expenses',
-                'operating income', 'operating profit',
-                'income before tax', 'pretax income',
-                'net income', 'net profit', 'net earnings',
-                'total assets', 'total liabilities',
-                'shareholders equity', 'stockholders equity',
-                'operating cash flow', 'cash from operations',
-                'investing cash flow', 'financing cash flow'
-            ]
+        self._type_codes = array.array('b')
+        self._page_from = array.array('i')
+        self._page_to = array.array('i')
+        self._contents: List[str] = []
+        self._page_refs: List[str] = []
+        self._raw_data: List = []
+        # 追加時同步維護的型別分區索引，
+        # 下游按型別遍歷時不必逐段比較 section.type
+        self._indices_by_type: Dict[str, List[int]] = {
+            t: [] for t in _SECTION_TYPES_BY_CODE
         }
-    
+
+    def append(self, type: str, page_from: int, page_to: int,
+               content: str, page_ref: str, raw_data=None) -> None:
+        """追加一個段落的各欄位"""
+        self._indices_by_type[type].append(len(self._type_codes))
+        self._type_codes.append(_SECTION_TYPE_CODES[type])
+        self._page_from.append(page_from)
+        self._page_to.append(page_to)
+        self._contents.append(content)
+        self._page_refs.append(page_ref)
+        self._raw_data.append(raw_data)
+
+    def iter_type(self, type: str):
+        """依型別分區索引遍歷該型別的段落視圖"""
+        for i in self._indices_by_type[type]:
+            yield self._view(i)
+
+    @property
+    def text_sections(self):
+        return self.iter_type('text')
+
+    @property
+    def table_sections(self):
+        return self.iter_type('table')
+
+    def _view(self, index: int) -> Section:
+        """以指定索引的欄位組出 Section 視圖"""
+        return Section(
+            type=_SECTION_TYPES_BY_CODE[self._type_codes[index]],
+            page_from=self._page_from[index],
+            page_to=self._page_to[index],
+            content=self._contents[index],
+            page_ref=self._page_refs[index],
+            raw_data=self._raw_data[index]
+        )
+
+    def __len__(self) -> int:
+        return len(self._type_codes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._view(i) for i in range(*index.indices(len(self)))]
+        return self._view(index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._view(i)
+
+def _extract_page(pdf_path: str, page_num: int, extract_tables: bool = True):
+    """
+    抽取單頁的文字與表格
+    頂層函數，供 ProcessPoolExecutor 序列化分派使用
+    表格抽取是 pdfplumber 最慢的操作，頁面文字無財務關鍵字時直接跳過
+    """
+    with pdfplumber.open(pdf_path, pages=[page_num + 1]) as pdf:
+        page = pdf.pages[0]
+        text = page.extract_text()
+        tables = (page.extract_tables()
+                  if extract_tables and _has_financial_keyword(text) else [])
+        return page_num, text, tables
+
+if msgspec is not None:
+    class Report(msgspec.Struct):
+        report_id: str
+        company: str
+        fiscal_year: int
+        period: str  # FY, Q1, Q2, Q3, Q4, TTM
+        currency: str
+        sections: SectionArray
+else:
+    @dataclass
+    class Report:
+        report_id: str
+        company: str
+        fiscal_year: int
+        period: str  # FY, Q1, Q2, Q3, Q4, TTM
+        currency: str
+        sections: SectionArray
+
+
+# 財務關鍵字：頁面文字含任一關鍵字才值得執行表格抽取
+FINANCIAL_KEYWORDS = {
+    'zh': [
+        '損益表', '綜合損益表', '利潤表', '收益表',
+        '資產負債表', '財務狀況表', '資產負債及股東權益表',
+        '現金流量表', '現金流表',
+        '營業收入', '營收', '銷售收入', '總收入',
+        '營業成本', '銷售成本', '營業費用',
+        '營業利益', '營業利潤', '經營利潤',
+        '稅前利益', '稅前利潤', '稅前盈餘',
+        '本期淨利', '淨利潤', '淨收益', '稅後淨利',
+        '總資產', '資產總額', '總負債', '負債總額',
+        '股東權益', '所有者權益', '淨資產',
+        '營業活動現金流量', '經營活動現金流量',
+        '投資活動現金流量', '融資活動現金流量'
+    ],
+    'en': [
+        'income statement', 'statement of income', 'profit and loss',
+        'balance sheet', 'statement of financial position',
+        'cash flow statement', 'statement of cash flows',
+        'revenue', 'sales', 'net sales', 'total revenue',
+        'cost of sales', 'cost of goods sold', 'operating expenses',
+        'operating income', 'operating profit',
+        'income before tax', 'pretax income',
+        'net income', 'net profit', 'net earnings',
+        'total assets', 'total liabilities',
+        'shareholders equity', 'stockholders equity',
+        'operating cash flow', 'cash from operations',
+        'investing cash flow', 'financing cash flow'
+    ]
+}
+
+_ALL_FIN_KEYWORDS = [kw.lower() for kws in FINANCIAL_KEYWORDS.values() for kw in kws]
+
+# 模組層級建構，行程池的工作行程也能直接使用
+if ahocorasick is not None:
+    _FIN_AUTO = ahocorasick.Automaton()
+    for _kw in _ALL_FIN_KEYWORDS:
+        _FIN_AUTO.add_word(_kw, _kw)
+    _FIN_AUTO.make_automaton()
+    _FIN_RE = None
+else:
+    _FIN_AUTO = None
+    _FIN_RE = re.compile('|'.join(map(re.escape, _ALL_FIN_KEYWORDS)))
+
+def _has_financial_keyword(text: Optional[str]) -> bool:
+    """判斷頁面文字是否命中財務關鍵字"""
+    if not text:
+        return False
+    lowered = text.lower()
+    if _FIN_AUTO is not None:
+        return next(_FIN_AUTO.iter(lowered), None) is not None
+    return _FIN_RE.search(lowered) is not None
+
+class PDFParser:
+    def __init__(self, backend: str = 'pymupdf'):
+        # MuPDF 為 C++ 實作，文字層 PDF 的抽取比 pdfminer 的
+        # Python 物件樹快數倍；未安裝或抽不出文字時退回 pdfplumber
+        if backend == 'pymupdf' and fitz is None:
+            backend = 'pdfplumber'
+        self.backend = backend
+
+        self.financial_keywords = FINANCIAL_KEYWORDS
+
+        # 報表類別與公司名稱標記關鍵字
+        self.statement_keywords = {
+            'income': ['損益', '利潤', '收益', 'income', 'profit'],
+            'balance': ['資產負債', '財務狀況', 'balance', 'position'],
+            'cashflow': ['現金流', 'cash flow', 'cash flows']
+        }
+        self.company_markers = ['股份有限公司', 'Corporation', 'Inc.', 'Ltd', '公司']
+
+        # 單一自動機一趟掃出所有類別命中，取代逐關鍵字的子字串搜索
+        if ahocorasick is not None:
+            self._stmt_auto = ahocorasick.Automaton()
+            for category, keywords in self.statement_keywords.items():
+                for kw in keywords:
+                    self._stmt_auto.add_word(kw, category)
+            self._stmt_auto.make_automaton()
+
+            self._company_auto = ahocorasick.Automaton()
+            for kw in self.company_markers:
+                self._company_auto.add_word(kw, kw)
+            self._company_auto.make_automaton()
+        else:
+            self._stmt_auto = None
+            self._company_auto = None
+            # 後備路徑：所有類別關鍵字合併為單一具名群組 alternation，
+            # 一次 finditer 掃描取代逐關鍵字的 in 迴圈
+            self._stmt_re = re.compile('|'.join(
+                '(?P<{}>{})'.format(category, '|'.join(map(re.escape, keywords)))
+                for category, keywords in self.statement_keywords.items()
+            ))
+            self._company_re = re.compile('|'.join(map(re.escape, self.company_markers)))
+
+        # 文字層檢測結果快取（以路徑 + mtime + 大小為鍵的小型 LRU），
+        # 讓「先 detect 再 parse」的流程只開檔解析一次
+        self._text_layer_cache: OrderedDict = OrderedDict()
+        self._text_layer_cache_size = 8
+
+        # 跨執行的解析結果快取目錄（以檔案內容雜湊為鍵）
+        self._cache_dir = os.path.expanduser('~/.arcompare/cache')
+
+        # 內容字串池：報告的頁首/頁尾模板常逐頁重複，
+        # 以內容雜湊去重後相同文字共用同一個字串物件
+        self._string_pool: Dict[bytes, str] = {}
+        # 報表類別分類結果快取（鍵與字串池同為內容雜湊）
+        self._category_cache: Dict[bytes, set] = {}
+
+    @staticmethod
+    def _content_digest(content: str) -> bytes:
+        """段落內容的 128-bit blake2b 雜湊，供字串池與分類快取共用"""
+        return hashlib.blake2b(content.encode(), digest_size=16).digest()
+
+    def _intern_content(self, content: str) -> str:
+        """重複出現的內容只保留第一份，後續引用共用同一字串"""
+        return self._string_pool.setdefault(self._content_digest(content), content)
+
+    @staticmethod
+    def _cache_key(pdf_path: str):
+        """以檔案路徑與 stat 資訊組成快取鍵，檔案變動即失效"""
+        st = os.stat(pdf_path)
+        return (pdf_path, st.st_mtime_ns, st.st_size)
+
+    def _remember_text_layer(self, key, has_text: bool) -> None:
+        """寫入文字層檢測快取並維持 LRU 上限"""
+        self._text_layer_cache[key] = has_text
+        self._text_layer_cache.move_to_end(key)
+        while len(self._text_layer_cache) > self._text_layer_cache_size:
+            self._text_layer_cache.popitem(last=False)
+
     def detect_pdf_type(self, pdf_path: str) -> bool:
         """
         檢測 PDF 是否有文字層
         返回 True 表示有文字層，False 表示需要 OCR
+        同一份檔案若已由 parse_pdf 處理過，直接回傳快取結果
         """
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                # 檢查前幾頁是否有文字
-                for i, page in enumerate(pdf.pages[:3]):  # 檢查前3頁
-                    text = page.extract_text()
-                    if text and len(text.strip()) > 50:  # 如果有足夠的文字
-                        return True
-                return False
+            key = self._cache_key(pdf_path)
+            if key in self._text_layer_cache:
+                self._text_layer_cache.move_to_end(key)
+                return self._text_layer_cache[key]
+
+            # 直接走 pdfminer 的文字抽取，不經 pdfplumber 的 Page 物件層
+            # （後者會為每頁建立 rects/curves 等物件樹，抽樣檢測用不到）
+            text = pdfminer_extract_text(pdf_path, page_numbers=[0, 1, 2], maxpages=3)
+            has_text = bool(text and len(text.strip()) > 50)  # 如果有足夠的文字
+
+            self._remember_text_layer(key, has_text)
+            return has_text
         except Exception as e:
             print(f"檢測 PDF 類型時發生錯誤: {e}")
             return False
     
-    def parse_pdf(self, pdf_path: str, company: str = "", fiscal_year: int = 2023) -> Report:
+    def _extract_pages(self, pdf_path: str, max_workers: Optional[int] = None,
+                       batch_pages: int = 500, extract_tables: bool = True) -> List[tuple]:
+        """
+        逐頁抽取文字與表格
+        頁數多時把頁面範圍分派到行程池，多核近線性加速；
+        少頁數時行程池啟動成本划不來，直接在當前行程抽取。
+        單行程路徑以 batch_pages 為單位分批開檔，批間關閉 handle
+        釋放 pdfminer 的內部物件快取，峰值記憶體不隨總頁數增長
+        """
+        if self.backend == 'pymupdf' and fitz is not None:
+            results = self._extract_pages_pymupdf(pdf_path, extract_tables)
+            if results is not None:
+                return results
+            # MuPDF 抽不出任何文字（多半是掃描檔），退回 pdfplumber 路徑
+
+        with pdfplumber.open(pdf_path) as pdf:
+            total_pages = len(pdf.pages)
+
+        workers = max_workers if max_workers is not None else (os.cpu_count() or 1)
+
+        if total_pages < 8 or workers <= 1:
+            results = []
+            for start in range(0, total_pages, batch_pages):
+                page_numbers = list(range(start + 1, min(start + batch_pages, total_pages) + 1))
+                with pdfplumber.open(pdf_path, pages=page_numbers) as pdf:
+                    for offset, page in enumerate(pdf.pages):
+                        text = page.extract_text()
+                        # 無財務關鍵字的頁面跳過昂貴的表格抽取
+                        tables = (page.extract_tables()
+                                  if extract_tables and _has_financial_keyword(text) else [])
+                        results.append((start + offset, text, tables))
+            return results
+
+        workers = min(workers, total_pages)
+        chunksize = max(1, total_pages // (4 * workers))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(
+                _extract_page,
+                [pdf_path] * total_pages,
+                range(total_pages),
+                [extract_tables] * total_pages,
+                chunksize=chunksize
+            ))
+
+    def _extract_pages_pymupdf(self, pdf_path: str,
+                               extract_tables: bool = True) -> Optional[List[tuple]]:
+        """
+        以 PyMuPDF 逐頁抽取文字與表格
+        文字與表格都在 C 層組好回來，不產生 pdfminer 式的逐字元物件樹，
+        單執行緒即足夠快，無需行程池。
+        整份文件抽不出任何文字時回傳 None，讓呼叫端退回 pdfplumber
+        """
+        results = []
+        any_text = False
+
+        with fitz.open(pdf_path) as doc:
+            for page_num, page in enumerate(doc):
+                text = page.get_text('text')
+                if text and text.strip():
+                    any_text = True
+
+                tables = []
+                if extract_tables and _has_financial_keyword(text):
+                    # find_tables 回傳 C 層定位好的表格，extract 轉出原始列資料
+                    tables = [tbl.extract() for tbl in page.find_tables()]
+
+                results.append((page_num, text, tables))
+
+        return results if any_text else None
+
+    def parse_pdf(self, pdf_path: str, company: str = "", fiscal_year: int = 2023,
+                  max_workers: Optional[int] = None, batch_pages: int = 500,
+                  extract_tables: bool = True) -> Report:
         """
         解析 PDF 文件，抽取文字和表格
         """
-        sections = []
-        
+        sections = SectionArray()
+        has_text_layer = False
+
+        # 相同內容的檔案跨執行只解析一次
+        cache_file = self._parse_cache_path(pdf_path)
+        cached = self._load_parse_cache(cache_file)
+        if cached is not None:
+            sections, has_text_layer = cached
+            self._remember_text_layer(self._cache_key(pdf_path), has_text_layer)
+            return self._build_report(sections, company, fiscal_year)
+
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                total_pages = len(pdf.pages)
-                
-                for page_num, page in enumerate(pdf.pages):
-                    page_ref = f"第{page_num + 1}頁"
-                    
-                    # 抽取文字
-                    text = page.extract_text()
-                    if text and len(text.strip()) > 20:
-                        sections.append(Section(
-                            type=SectionType.TEXT,
+            # 逐頁結果按頁碼排序回來，重組順序與單程序版一致
+            for page_num, text, tables in self._extract_pages(pdf_path, max_workers,
+                                                              batch_pages, extract_tables):
+                page_ref = f"第{page_num + 1}頁"
+
+                # 順手記錄文字層檢測結果，省去 detect_pdf_type 再開一次檔
+                if page_num < 3 and text and len(text.strip()) > 50:
+                    has_text_layer = True
+
+                if text and len(text.strip()) > 20:
+                    sections.append(
+                        type='text',
+                        page_from=page_num + 1,
+                        page_to=page_num + 1,
+                        content=self._intern_content(text.strip()),
+                        page_ref=page_ref
+                    )
+
+                # 抽取表格
+                for table_idx, table in enumerate(tables):
+                    if table and len(table) > 1:  # 至少有標題行和數據行
+                        # 保留原始列資料，DataFrame 延後到實際需要時建構；
+                        # 關鍵字分類用 tab-join 攤平的文字即可
+                        table_text = '\n'.join(
+                            '\t'.join('' if cell is None else str(cell) for cell in row)
+                            for row in table
+                        )
+
+                        sections.append(
+                            type='table',
                             page_from=page_num + 1,
                             page_to=page_num + 1,
-                            content=text.strip(),
-                            page_ref=page_ref
-                        ))
-                    
-                    # 抽取表格
-                    tables = page.extract_tables()
-                    for table_idx, table in enumerate(tables):
-                        if table and len(table) > 1:  # 至少有標題行和數據行
-                            # 將表格轉換為 DataFrame
-                            df = pd.DataFrame(table[1:], columns=table[0])
-                            
-                            sections.append(Section(
-                                type=SectionType.TABLE,
-                                page_from=page_num + 1,
-                                page_to=page_num + 1,
-                                content=f"表格 {table_idx + 1}: {df.to_string()}",
-                                page_ref=f"{page_ref}_表格{table_idx + 1}",
-                                raw_data=df
-                            ))
-        
+                            content=self._intern_content(f"表格 {table_idx + 1}: {table_text}"),
+                            page_ref=f"{page_ref}_表格{table_idx + 1}",
+                            raw_data=table
+                        )
+
+            self._remember_text_layer(self._cache_key(pdf_path), has_text_layer)
+
         except Exception as e:
             print(f"解析 PDF 時發生錯誤: {e}")
-        
+
+        if len(sections):  # 解析失敗的空結果不落盤
+            self._save_parse_cache(cache_file, sections, has_text_layer)
+
+        return self._build_report(sections, company, fiscal_year)
+
+    def _build_report(self, sections: SectionArray, company: str, fiscal_year: int) -> Report:
+        """由解析好的段落組出 Report"""
         # 嘗試提取公司資訊
         if not company:
             company = self._extract_company_name(sections)
-        
+
         report_id = f"{company}_{fiscal_year}"
-        
+
         return Report(
             report_id=report_id,
             company=company,
@@ -139,18 +552,53 @@ class PDFParser:
             currency="",  # 後續從內容中提取
             sections=sections
         )
-    
-    def _extract_company_name(self, sections: List[Section]) -> str:
+
+    def _parse_cache_path(self, pdf_path: str) -> Optional[str]:
+        """以檔案內容 md5 + 解析器版本組出快取路徑"""
+        try:
+            with open(pdf_path, 'rb') as f:
+                digest = hashlib.md5(f.read()).hexdigest()
+        except OSError:
+            return None
+        return os.path.join(self._cache_dir, f"{digest}_v{PARSER_VERSION}.pkl")
+
+    def _load_parse_cache(self, cache_file: Optional[str]):
+        """讀取解析快取，失敗時當作未命中"""
+        if cache_file is None or not os.path.exists(cache_file):
+            return None
+        try:
+            with open(cache_file, 'rb') as f:
+                return pickle.load(f)
+        except Exception as e:
+            print(f"讀取解析快取失敗: {e}")
+            return None
+
+    def _save_parse_cache(self, cache_file: Optional[str], sections: SectionArray,
+                          has_text_layer: bool) -> None:
+        """寫入解析快取"""
+        if cache_file is None:
+            return
+        try:
+            os.makedirs(self._cache_dir, exist_ok=True)
+            with open(cache_file, 'wb') as f:
+                pickle.dump((sections, has_text_layer), f)
+        except Exception as e:
+            print(f"寫入解析快取失敗: {e}")
+
+    def _extract_company_name(self, sections: SectionArray) -> str:
         """
         從文檔內容中提取公司名稱
         """
         for section in sections[:5]:  # 檢查前5個段落
-            if section.type == SectionType.TEXT:
+            if section.type == 'text':
                 text = section.content
                 # 簡單的公司名稱提取邏輯
                 lines = text.split('\n')
                 for line in lines[:10]:  # 檢查前10行
-                    if any(keyword in line for keyword in ['股份有限公司', 'Corporation', 'Inc.', 'Ltd', '公司']):
+                    if self._company_auto is not None:
+                        if next(self._company_auto.iter(line), None) is not None:
+                            return line.strip()
+                    elif self._company_re.search(line):
                         return line.strip()
         return "未知公司"
     
@@ -164,36 +612,49 @@ class PDFParser:
             'cashflow': pd.DataFrame()
         }
         
-        for section in report.sections:
-            if section.type == SectionType.TABLE and section.raw_data is not None:
-                df = section.raw_data
-                
-                # 檢查是否為財務報表
-                table_content = section.content.lower()
-                
-                if self._is_income_statement(table_content):
-                    statements['income'] = df
-                elif self._is_balance_sheet(table_content):
-                    statements['balance'] = df
-                elif self._is_cashflow_statement(table_content):
-                    statements['cashflow'] = df
-        
+        # 只遍歷表格分區，不對全部段落逐一做型別檢查
+        for section in report.sections.table_sections:
+            if section.raw_data is not None:
+                # 檢查是否為財務報表（一趟掃描取得所有類別命中），
+                # 只有被分類命中的表格才付 DataFrame 建構成本；
+                # 相同內容（池內共用）的分類結果直接命中快取
+                categories = self._categories_for(section.content)
+
+                if 'income' in categories:
+                    statements['income'] = section.df
+                elif 'balance' in categories:
+                    statements['balance'] = section.df
+                elif 'cashflow' in categories:
+                    statements['cashflow'] = section.df
+
         return statements
-    
+
+    def _statement_categories(self, text: str) -> set:
+        """單次線性掃描，回傳文本命中的報表類別集合"""
+        if self._stmt_auto is not None:
+            return {category for _, category in self._stmt_auto.iter(text)}
+        return {match.lastgroup for match in self._stmt_re.finditer(text)}
+
+    def _categories_for(self, content: str) -> set:
+        """以內容雜湊快取分類結果，重複的表格模板只掃描一次"""
+        digest = self._content_digest(content)
+        categories = self._category_cache.get(digest)
+        if categories is None:
+            categories = self._statement_categories(content.lower())
+            self._category_cache[digest] = categories
+        return categories
+
     def _is_income_statement(self, text: str) -> bool:
         """判斷是否為損益表"""
-        keywords = ['損益', '利潤', '收益', 'income', 'profit']
-        return any(keyword in text for keyword in keywords)
-    
+        return 'income' in self._statement_categories(text)
+
     def _is_balance_sheet(self, text: str) -> bool:
         """判斷是否為資產負債表"""
-        keywords = ['資產負債', '財務狀況', 'balance', 'position']
-        return any(keyword in text for keyword in keywords)
-    
+        return 'balance' in self._statement_categories(text)
+
     def _is_cashflow_statement(self, text: str) -> bool:
         """判斷是否為現金流量表"""
-        keywords = ['現金流', 'cash flow', 'cash flows']
-        return any(keyword in text for keyword in keywords)
+        return 'cashflow' in self._statement_categories(text)
     
     def slice_content_for_search(self, report: Report, chunk_size: int = 500) -> List[Dict]:
         """
@@ -201,34 +662,35 @@ class PDFParser:
         """
         chunks = []
         chunk_id = 0
-        
-        for section in report.sections:
-            if section.type == SectionType.TEXT:
-                # 將長文本切分為小塊
-                text = section.content
-                words = text.split()
-                
-                for i in range(0, len(words), chunk_size):
-                    chunk_text = ' '.join(words[i:i + chunk_size])
-                    if len(chunk_text.strip()) > 50:  # 過濾太短的片段
-                        chunks.append({
-                            'doc_id': report.report_id,
-                            'chunk_id': f"{report.report_id}_chunk_{chunk_id}",
-                            'text': chunk_text,
-                            'page_ref': section.page_ref,
-                            'section_type': section.type.value
-                        })
-                        chunk_id += 1
-            
-            elif section.type == SectionType.TABLE:
-                # 表格內容也加入檢索
-                chunks.append({
-                    'doc_id': report.report_id,
-                    'chunk_id': f"{report.report_id}_table_{chunk_id}",
-                    'text': section.content,
-                    'page_ref': section.page_ref,
-                    'section_type': section.type.value
-                })
-                chunk_id += 1
-        
+
+        # 前綴在迴圈外拼好，迴圈內只剩一次串接，免去逐 chunk 的 f-string 格式化
+        text_prefix = report.report_id + "_chunk_"
+        table_prefix = report.report_id + "_table_"
+
+        # 兩個型別分區前後接續遍歷，迴圈內不再有型別分支
+        for section in report.sections.text_sections:
+            # 將長文本切分為小塊：詞邊界與視窗計算在 _iter_text_chunks
+            # 內惰性進行，這裡只消費逐個 yield 出來的切片
+            for chunk_text in _iter_text_chunks(section.content, chunk_size):
+                if len(chunk_text.strip()) > 50:  # 過濾太短的片段
+                    chunks.append({
+                        'doc_id': report.report_id,
+                        'chunk_id': text_prefix + str(chunk_id),
+                        'text': chunk_text,
+                        'page_ref': section.page_ref,
+                        'section_type': 'text'
+                    })
+                    chunk_id += 1
+
+        # 表格內容也加入檢索
+        for section in report.sections.table_sections:
+            chunks.append({
+                'doc_id': report.report_id,
+                'chunk_id': table_prefix + str(chunk_id),
+                'text': section.content,
+                'page_ref': section.page_ref,
+                'section_type': 'table'
+            })
+            chunk_id += 1
+
         return chunks
\ No newline at end of file
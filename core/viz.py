@@ -2,19 +2,135 @@
 可視化模組
 支援財務指標的圖表展示
 """
+import html
 import plotly.graph_objects as go
-import plotly.express as px
 import pandas as pd
 import streamlit as st
 from typing import Dict, List, Optional
 
+from core.metrics import CompanyMetrics
+
+_COLOR_PALETTE = [
+    '#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd',
+    '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf'
+]
+
+# 概覽卡片顯示的關鍵指標：(指標代碼, 顯示名稱, 數值後綴)
+_OVERVIEW_METRICS = (
+    ('net_margin', '淨利率', '%'),
+    ('roe', 'ROE', '%'),
+    ('debt_ratio', '負債比率', '%'),
+    ('asset_turnover', '資產周轉率', '倍'),
+)
+
+# 仿 st.metric 外觀的行內樣式（label 淡灰小字、value 大字）
+_CARD_STYLE = 'padding:0.25rem 0;'
+_LABEL_STYLE = 'font-size:0.875rem;color:rgba(49,51,63,0.6);'
+_VALUE_STYLE = 'font-size:1.75rem;font-weight:600;line-height:1.4;'
+
+def _metrics_cards_html(cm: CompanyMetrics) -> str:
+    """
+    將一家公司的關鍵指標組成單一 CSS grid HTML 區塊
+    一次 st.markdown 送出全部卡片，取代逐指標的 st.metric 訊息往返
+    """
+    cards = []
+    for key, label, suffix in _OVERVIEW_METRICS:
+        metric = cm.metrics.get(key)
+        if metric is None:
+            continue
+        cards.append(
+            '<div style="{}" title="{}">'
+            '<div style="{}">{}</div>'
+            '<div style="{}">{}{}</div>'
+            '</div>'.format(
+                _CARD_STYLE, html.escape(metric.calculation_method),
+                _LABEL_STYLE, label,
+                _VALUE_STYLE, metric.value, suffix
+            )
+        )
+    if not cards:
+        return ''
+    return ('<div style="display:grid;grid-template-columns:repeat(4,1fr);gap:1rem;">'
+            + ''.join(cards) + '</div>')
+
+def _hash_company_metrics(cm: CompanyMetrics):
+    """供 st.cache_data 使用的穩定雜湊：公司 + 年度 + 各指標數值"""
+    return (cm.company, cm.fiscal_year,
+            tuple(sorted((key, metric.value) for key, metric in cm.metrics.items())))
+
+@st.cache_data(max_entries=64, hash_funcs={CompanyMetrics: _hash_company_metrics})
+def _prepare_chart_data(company_metrics_list, metric_keys: tuple) -> pd.DataFrame:
+    """
+    準備圖表數據
+    Streamlit 每次 rerun 都重跑整個腳本；以指標內容為鍵快取，
+    未變動的輸入直接重用先前的 DataFrame
+    """
+    # 逐欄累積後一次建表，避免 list-of-dicts 讓 pandas 逐列推斷型別
+    companies = []
+    years = []
+    names = []
+    codes = []
+    values = []
+    units = []
+
+    for cm in company_metrics_list:
+        for metric_key in metric_keys:
+            if metric_key in cm.metrics:
+                metric = cm.metrics[metric_key]
+                companies.append(cm.company)
+                years.append(cm.fiscal_year)
+                names.append(metric.name)
+                codes.append(metric_key)
+                values.append(metric.value)
+                units.append(metric.unit)
+
+    return pd.DataFrame({
+        '公司': companies,
+        '年度': years,
+        '指標': names,
+        '指標代碼': codes,
+        '數值': values,
+        '單位': units
+    })
+
+@st.cache_data(max_entries=64)
+def _create_bar_chart(df: pd.DataFrame, category_name: str) -> go.Figure:
+    """
+    創建柱狀圖
+    相同數據重複渲染時直接命中快取，省掉 Plotly 圖表重建與序列化
+    """
+    if df.empty:
+        return go.Figure()
+
+    # 每家公司一條 go.Bar trace（px.bar 內部也是這樣拆，
+    # 但會先對 DataFrame 做整套欄位推斷與分組；這裡直接建 trace 省掉該層）
+    fig = go.Figure()
+    for idx, (company, sub) in enumerate(df.groupby('公司', sort=False)):
+        fig.add_trace(go.Bar(
+            name=company,
+            x=sub['指標'].to_numpy(),
+            y=sub['數值'].to_numpy(),
+            marker_color=_COLOR_PALETTE[idx % len(_COLOR_PALETTE)],
+            texttemplate='%{y}',
+            textposition='outside'
+        ))
+
+    fig.update_layout(
+        title=f"{category_name}指標比較",
+        barmode='group',
+        xaxis_title="指標",
+        yaxis_title="數值",
+        legend_title="公司",
+        height=500,
+        showlegend=True
+    )
+
+    return fig
+
 class FinancialVisualizer:
     def __init__(self):
-        self.color_palette = [
-            '#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd',
-            '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf'
-        ]
-        
+        self.color_palette = _COLOR_PALETTE
+
         self.ratio_categories = {
             "profitability": {
                 "name": "盈利能力",
@@ -46,53 +162,16 @@ class FinancialVisualizer:
             st.warning("沒有可顯示的指標數據")
             return
         
-        # 顯示每家公司的關鍵指標卡片
-        for i, cm in enumerate(company_metrics_list):
+        # 每家公司的關鍵指標合成單一 HTML 區塊一次送出：
+        # 4 個 st.metric + st.columns 會產生多則 WebSocket 訊息與 widget 配置，
+        # 這裡每家公司只剩一次 markdown 渲染（計算方式放在 title 提示）
+        for cm in company_metrics_list:
             st.subheader(f"{cm.company} ({cm.fiscal_year})")
-            
-            # 創建4列布局顯示關鍵指標
-            col1, col2, col3, col4 = st.columns(4)
-            
-            # 淨利率
-            if 'net_margin' in cm.metrics:
-                with col1:
-                    metric = cm.metrics['net_margin']
-                    st.metric(
-                        label="淨利率",
-                        value=f"{metric.value}%",
-                        help=metric.calculation_method
-                    )
-            
-            # ROE
-            if 'roe' in cm.metrics:
-                with col2:
-                    metric = cm.metrics['roe']
-                    st.metric(
-                        label="ROE",
-                        value=f"{metric.value}%",
-                        help=metric.calculation_method
-                    )
-            
-            # 負債比率
-            if 'debt_ratio' in cm.metrics:
-                with col3:
-                    metric = cm.metrics['debt_ratio']
-                    st.metric(
-                        label="負債比率",
-                        value=f"{metric.value}%",
-                        help=metric.calculation_method
-                    )
-            
-            # 資產周轉率
-            if 'asset_turnover' in cm.metrics:
-                with col4:
-                    metric = cm.metrics['asset_turnover']
-                    st.metric(
-                        label="資產周轉率",
-                        value=f"{metric.value}倍",
-                        help=metric.calculation_method
-                    )
-            
+
+            cards_html = _metrics_cards_html(cm)
+            if cards_html:
+                st.markdown(cards_html, unsafe_allow_html=True)
+
             st.divider()
     
     def create_comparison_charts(self, company_metrics_list, selected_categories: List[str]) -> None:
@@ -109,66 +188,14 @@ class FinancialVisualizer:
             category_info = self.ratio_categories[category]
             st.subheader(f"📊 {category_info['name']}比較")
             
-            # 收集該類別的數據
-            chart_data = self._prepare_chart_data(company_metrics_list, category_info['metrics'])
-            
+            # 收集該類別的數據（以 tuple 傳入讓快取鍵穩定）
+            chart_data = _prepare_chart_data(company_metrics_list,
+                                             tuple(category_info['metrics']))
+
             if chart_data.empty:
                 st.info(f"暫無{category_info['name']}相關數據")
                 continue
-            
+
             # 創建柱狀圖
-            fig = self._create_bar_chart(chart_data, category_info['name'])
-            st.plotly_chart(fig, use_container_width=True)
-    
-    def _prepare_chart_data(self, company_metrics_list, metric_keys: List[str]) -> pd.DataFrame:
-        """
-        準備圖表數據
-        """
-        data = []
-        
-        for cm in company_metrics_list:
-            for metric_key in metric_keys:
-                if metric_key in cm.metrics:
-                    metric = cm.metrics[metric_key]
-                    data.append({
-                        '公司': cm.company,
-                        '年度': cm.fiscal_year,
-                        '指標': metric.name,
-                        '指標代碼': metric_key,
-                        '數值': metric.value,
-                        '單位': metric.unit
-                    })
-        
-        return pd.DataFrame(data)
-    
-    def _create_bar_chart(self, df: pd.DataFrame, category_name: str) -> go.Figure:
-        """
-        創建柱狀圖
-        """
-        if df.empty:
-            return go.Figure()
-        
-        # 使用 plotly express 創建分組柱狀圖
-        fig = px.bar(
-            df,
-            x='指標',
-            y='數值',
-            color='公司',
-            title=f"{category_name}指標比較",
-            barmode='group',
-            color_discrete_sequence=self.color_palette
-        )
-        
-        # 美化圖表
-        fig.update_layout(
-            xaxis_title="指標",
-            yaxis_title="數值",
-            legend_title="公司",
-            height=500,
-            showlegend=True
-        )
-        
-        # 添加數值標籤
-        fig.update_traces(texttemplate='%{y}', textposition='outside')
-        
-        return fig
\ No newline at end of file
+            fig = _create_bar_chart(chart_data, category_info['name'])
+            st.plotly_chart(fig, use_container_width=True)
\ No newline at end of file